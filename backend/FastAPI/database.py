@@ -21,4 +21,8 @@ def get_db():
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     print("✅ Database tables created successfully")
\ No newline at end of file
@@ -0,0 +1,158 @@
+# follows.py
+import heapq
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+
+# Настройки
+HIGH_FANOUT_THRESHOLD = 1000        # с какого числа подписчиков кэшируем множество
+MAX_CACHED_ACCOUNTS = 100           # сколько популярных аккаунтов держим в памяти
+FEED_AUTHORS_CHUNK = 500            # авторов в одном запросе ленты
+
+
+class FollowerCache:
+    """
+    LRU-кэш множеств id подписчиков для аккаунтов с большим числом подписчиков.
+    Кэш живет в памяти процесса: подписки, обработанные другим воркером uvicorn,
+    сюда не попадут. Рассчитан на запуск API в одном процессе.
+    """
+
+    def __init__(self, capacity: int = MAX_CACHED_ACCOUNTS):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._sets: "OrderedDict[int, Set[int]]" = OrderedDict()
+        # Аккаунты, которые сейчас грузятся: изменения за время загрузки копим здесь
+        self._loading: Dict[int, List[Tuple[bool, int]]] = {}
+
+    def get(self, user_id: int) -> Optional[Set[int]]:
+        with self._lock:
+            followers = self._sets.get(user_id)
+            if followers is not None:
+                self._sets.move_to_end(user_id)
+            return followers
+
+    def ensure(self, db: Session, user: models.User):
+        """Загружает подписчиков в кэш, если аккаунт достаточно популярен"""
+        if (user.followers_count or 0) < HIGH_FANOUT_THRESHOLD:
+            return
+        with self._lock:
+            if user.id in self._sets or user.id in self._loading:
+                return
+            self._loading[user.id] = []
+
+        try:
+            rows = db.query(models.Follow.follower_id).filter(models.Follow.followee_id == user.id).all()
+        except Exception:
+            with self._lock:
+                self._loading.pop(user.id, None)
+            raise
+
+        followers = {row[0] for row in rows}
+        with self._lock:
+            # Подписки/отписки, закоммиченные во время чтения, применяем поверх
+            for followed, follower_id in self._loading.pop(user.id):
+                if followed:
+                    followers.add(follower_id)
+                else:
+                    followers.discard(follower_id)
+            self._sets[user.id] = followers
+            self._sets.move_to_end(user.id)
+            while len(self._sets) > self.capacity:
+                self._sets.popitem(last=False)
+
+    def _apply(self, followed: bool, follower_id: int, followee_id: int):
+        with self._lock:
+            if followee_id in self._loading:
+                self._loading[followee_id].append((followed, follower_id))
+            elif followee_id in self._sets:
+                if followed:
+                    self._sets[followee_id].add(follower_id)
+                else:
+                    self._sets[followee_id].discard(follower_id)
+
+    def on_follow(self, follower_id: int, followee_id: int):
+        self._apply(True, follower_id, followee_id)
+
+    def on_unfollow(self, follower_id: int, followee_id: int):
+        self._apply(False, follower_id, followee_id)
+
+
+follower_cache = FollowerCache()
+
+
+def is_following_many(db: Session, follower_id: int, target_ids: Iterable[int]) -> Dict[int, bool]:
+    """Проверяет подписку на пачку пользователей: кэш + один запрос с IN"""
+    result = {}
+    uncached = []
+    for target_id in dict.fromkeys(target_ids):
+        followers = follower_cache.get(target_id)
+        if followers is not None:
+            result[target_id] = follower_id in followers
+        else:
+            uncached.append(target_id)
+
+    if uncached:
+        rows = db.query(models.Follow.followee_id).filter(
+            models.Follow.follower_id == follower_id,
+            models.Follow.followee_id.in_(uncached)
+        ).all()
+        followed = {row[0] for row in rows}
+        for target_id in uncached:
+            result[target_id] = target_id in followed
+
+    return result
+
+
+def _recent_meme_ids_by_author(db: Session, author_ids: List[int], per_author: int,
+                               before_id: Optional[int]) -> List[List[int]]:
+    """id последних per_author мемов каждого автора, каждый список по убыванию"""
+    conditions = [models.Meme.owner_id.in_(author_ids)]
+    if before_id is not None:
+        conditions.append(models.Meme.id < before_id)
+
+    # Только (id, owner_id) - целые строки мемов грузим лишь для итоговой страницы
+    ranked = select(
+        models.Meme.id,
+        models.Meme.owner_id,
+        func.row_number().over(
+            partition_by=models.Meme.owner_id,
+            order_by=models.Meme.id.desc()
+        ).label("rn")
+    ).where(*conditions).subquery()
+
+    rows = db.query(ranked.c.id, ranked.c.owner_id).filter(ranked.c.rn <= per_author).order_by(
+        ranked.c.owner_id, ranked.c.id.desc()
+    ).all()
+
+    lists: Dict[int, List[int]] = {}
+    for meme_id, owner_id in rows:
+        lists.setdefault(owner_id, []).append(meme_id)
+    return list(lists.values())
+
+
+def following_feed(db: Session, user_id: int, limit: int, before_id: Optional[int] = None) -> List[models.Meme]:
+    """
+    Лента подписок: для каждого автора берем id не больше limit последних мемов,
+    сливаем списки k-way merge'ем и одним IN-запросом загружаем победителей.
+    """
+    rows = db.query(models.Follow.followee_id).filter(models.Follow.follower_id == user_id).all()
+    author_ids = [row[0] for row in rows]
+
+    per_author_lists = []
+    for start in range(0, len(author_ids), FEED_AUTHORS_CHUNK):
+        chunk = author_ids[start:start + FEED_AUTHORS_CHUNK]
+        per_author_lists.extend(_recent_meme_ids_by_author(db, chunk, limit, before_id))
+
+    page_ids = list(islice(heapq.merge(*per_author_lists, reverse=True), limit))
+    if not page_ids:
+        return []
+
+    memes = db.query(models.Meme).filter(models.Meme.id.in_(page_ids)).all()
+    by_id = {meme.id: meme for meme in memes}
+    return [by_id[meme_id] for meme_id in page_ids if meme_id in by_id]
@@ -0,0 +1,291 @@
+# jobs.py
+import argparse
+import multiprocessing
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+
+# Настройки
+POLL_INTERVAL_SECONDS = 1.0
+RETRY_BASE_SECONDS = 10             # задержка перед повтором: 10s, 20s, 40s...
+RETRY_MAX_SECONDS = 3600
+JOB_TIMEOUT_SECONDS = 600           # running дольше - считаем, что воркер умер
+DEFAULT_WORKERS = 2
+
+# Реестр задач: имя -> функция(db, payload)
+TASKS: Dict[str, Callable] = {}
+
+
+def task(name: str):
+    """Регистрирует функцию как задачу очереди"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(
+    db: Session,
+    name: str,
+    payload: Optional[Dict] = None,
+    priority: int = 0,
+    delay_seconds: int = 0,
+    max_attempts: int = 3,
+    interval_seconds: Optional[int] = None
+) -> models.Job:
+    """Добавляет задачу в очередь. Чем больше priority, тем раньше выполнится"""
+    job = models.Job(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        status="queued",
+        max_attempts=max_attempts,
+        interval_seconds=interval_seconds,
+        run_at=datetime.utcnow() + timedelta(seconds=delay_seconds)
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def ensure_periodic(db: Session, name: str, interval_seconds: int,
+                    payload: Optional[Dict] = None, priority: int = 0):
+    """Создает периодическую задачу, если ее еще нет в очереди"""
+    existing = db.query(models.Job.id).filter(
+        models.Job.name == name,
+        models.Job.interval_seconds.isnot(None),
+        models.Job.status.in_(["queued", "running"])
+    ).first()
+    if existing:
+        return
+    enqueue(db, name, payload, priority=priority, interval_seconds=interval_seconds)
+
+
+def requeue_stale(db: Session) -> int:
+    """
+    Разбирает задачи зависших или упавших воркеров: повтор с backoff,
+    либо failed, если попытки кончились (периодические - на следующий интервал)
+    """
+    now = datetime.utcnow()
+    deadline = now - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    stale = db.query(models.Job).filter(
+        models.Job.status == "running",
+        models.Job.locked_at < deadline
+    ).all()
+
+    count = 0
+    for job in stale:
+        values = {
+            models.Job.status: "queued",
+            models.Job.locked_at: None,
+            models.Job.last_error: f"Worker timed out after {JOB_TIMEOUT_SECONDS}s"
+        }
+        if job.attempts < job.max_attempts:
+            values[models.Job.run_at] = now + timedelta(seconds=_retry_delay(job.attempts))
+        elif job.interval_seconds:
+            values[models.Job.attempts] = 0
+            values[models.Job.run_at] = now + timedelta(seconds=job.interval_seconds)
+        else:
+            values[models.Job.status] = "failed"
+
+        # Условие на locked_at - чтобы два воркера не обработали одну задачу дважды
+        count += db.query(models.Job).filter(
+            models.Job.id == job.id,
+            models.Job.status == "running",
+            models.Job.locked_at == job.locked_at
+        ).update(values, synchronize_session=False)
+        print(f"⏱️ Job {job.id} ({job.name}) timed out, attempt {job.attempts}/{job.max_attempts}")
+
+    db.commit()
+    return count
+
+
+def claim_next(db: Session) -> Optional[models.Job]:
+    """Забирает следующую готовую задачу. UPDATE с условием на status защищает от гонок воркеров"""
+    while True:
+        now = datetime.utcnow()
+        candidate = db.query(models.Job.id).filter(
+            models.Job.status == "queued",
+            models.Job.run_at <= now
+        ).order_by(models.Job.priority.desc(), models.Job.run_at).first()
+        if not candidate:
+            return None
+
+        claimed = db.query(models.Job).filter(
+            models.Job.id == candidate.id,
+            models.Job.status == "queued"
+        ).update({
+            models.Job.status: "running",
+            models.Job.locked_at: now,
+            models.Job.attempts: models.Job.attempts + 1
+        }, synchronize_session=False)
+        db.commit()
+
+        if claimed:
+            return db.get(models.Job, candidate.id)
+        # Другой воркер успел раньше - пробуем следующую
+
+
+def _retry_delay(attempts: int) -> int:
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+def _finish(db: Session, job_id: int, locked_at: datetime, values: Dict) -> bool:
+    """Записывает итог, только если задача все еще наша (не переотдана requeue_stale)"""
+    updated = db.query(models.Job).filter(
+        models.Job.id == job_id,
+        models.Job.status == "running",
+        models.Job.locked_at == locked_at
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+
+def run_job(db: Session, job: models.Job):
+    # Снимок до запуска: handler может откатить сессию и протушить объект
+    job_id, name, locked_at = job.id, job.name, job.locked_at
+    attempts, max_attempts, interval = job.attempts, job.max_attempts, job.interval_seconds
+    payload = job.payload or {}
+
+    handler = TASKS.get(name)
+    try:
+        if handler is None:
+            raise LookupError(f"Unknown task: {name}")
+        handler(db, payload)
+    except Exception:
+        db.rollback()
+        now = datetime.utcnow()
+        values = {
+            models.Job.status: "queued",
+            models.Job.locked_at: None,
+            models.Job.last_error: traceback.format_exc()[-2000:]
+        }
+        if attempts < max_attempts:
+            values[models.Job.run_at] = now + timedelta(seconds=_retry_delay(attempts))
+        elif interval:
+            # Периодическая задача не умирает - ждем следующего запуска
+            values[models.Job.attempts] = 0
+            values[models.Job.run_at] = now + timedelta(seconds=interval)
+        else:
+            values[models.Job.status] = "failed"
+        if _finish(db, job_id, locked_at, values):
+            print(f"❌ Job {job_id} ({name}) failed, attempt {attempts}/{max_attempts}")
+        else:
+            print(f"⚠️ Job {job_id} ({name}) failed after its lock was taken over, result dropped")
+        return
+
+    now = datetime.utcnow()
+    values = {models.Job.locked_at: None, models.Job.last_error: None}
+    if interval:
+        values[models.Job.status] = "queued"
+        values[models.Job.attempts] = 0
+        values[models.Job.run_at] = now + timedelta(seconds=interval)
+    else:
+        values[models.Job.status] = "done"
+    if _finish(db, job_id, locked_at, values):
+        print(f"✅ Job {job_id} ({name}) done")
+    else:
+        print(f"⚠️ Job {job_id} ({name}) finished after its lock was taken over, result dropped")
+
+
+def stats(db: Session) -> Dict:
+    """Сводка по очереди для мониторинга"""
+    counts = dict(
+        db.query(models.Job.status, func.count(models.Job.id)).group_by(models.Job.status).all()
+    )
+    now = datetime.utcnow()
+    due = db.query(func.count(models.Job.id)).filter(
+        models.Job.status == "queued",
+        models.Job.run_at <= now
+    ).scalar()
+    oldest_due = db.query(func.min(models.Job.run_at)).filter(
+        models.Job.status == "queued",
+        models.Job.run_at <= now
+    ).scalar()
+    failures = db.query(models.Job).filter(
+        models.Job.last_error.isnot(None)
+    ).order_by(models.Job.updated_at.desc()).limit(10).all()
+
+    return {
+        "counts": counts,
+        "due": due,
+        "oldest_due_seconds": (now - oldest_due).total_seconds() if oldest_due else 0,
+        "recent_failures": [
+            {
+                "id": job.id,
+                "name": job.name,
+                "status": job.status,
+                "attempts": job.attempts,
+                "max_attempts": job.max_attempts,
+                "last_error": job.last_error.strip().splitlines()[-1] if job.last_error else None,
+            }
+            for job in failures
+        ]
+    }
+
+
+def worker_loop(poll_interval: float = POLL_INTERVAL_SECONDS):
+    from database import SessionLocal
+    import tasks  # noqa: F401 - регистрирует задачи
+
+    print(f"👷 Job worker started (pid {multiprocessing.current_process().pid})")
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                requeue_stale(db)
+                job = claim_next(db)
+                if job is None:
+                    time.sleep(poll_interval)
+                    continue
+                run_job(db, job)
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                # Например "database is locked" - воркер не должен из-за этого умирать
+                db.rollback()
+                print(f"⚠️ Job worker error: {str(e)}")
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+def run_workers(count: int = DEFAULT_WORKERS, check_interval: float = 5.0):
+    """Запускает count воркеров и перезапускает упавшие"""
+    ctx = multiprocessing.get_context("spawn")
+
+    def start():
+        process = ctx.Process(target=worker_loop, daemon=True)
+        process.start()
+        return process
+
+    processes = [start() for _ in range(count)]
+    try:
+        while True:
+            time.sleep(check_interval)
+            for idx, process in enumerate(processes):
+                if not process.is_alive():
+                    print(f"⚠️ Job worker {process.pid} exited with code {process.exitcode}, restarting")
+                    processes[idx] = start()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Meme App job workers")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    # Импортируем модуль заново, чтобы воркеры и tasks.py делили один реестр TASKS
+    import jobs
+    jobs.run_workers(args.workers)
@@ -0,0 +1,70 @@
+# loaders.py
+from typing import Callable, Dict, Hashable, Iterable, List
+
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+import models
+from database import get_db
+
+MAX_BATCH_SIZE = 100
+
+
+class DataLoader:
+    """
+    Собирает ключи в течение запроса и загружает их одним запросом на пачку.
+    batch_fn получает список уникальных ключей и возвращает dict ключ -> объект.
+    Результаты кэшируются до конца запроса, отсутствующие ключи тоже.
+    """
+
+    def __init__(self, batch_fn: Callable[[List], Dict], max_batch_size: int = MAX_BATCH_SIZE):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self._cache: Dict = {}
+        self._pending: Dict = {}  # dict вместо set - сохраняет порядок
+
+    def prime(self, key: Hashable, value):
+        self._cache[key] = value
+
+    def want(self, key: Hashable):
+        """Отмечает ключ для загрузки при следующем dispatch()"""
+        if key not in self._cache:
+            self._pending[key] = None
+
+    def dispatch(self):
+        keys = list(self._pending)
+        self._pending.clear()
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = keys[start:start + self.max_batch_size]
+            found = self.batch_fn(chunk)
+            for key in chunk:
+                self._cache[key] = found.get(key)
+
+    def load_many(self, keys: Iterable[Hashable]) -> Dict:
+        """Возвращает dict ключ -> объект (None если не найден), без дублей"""
+        keys = list(dict.fromkeys(keys))
+        for key in keys:
+            self.want(key)
+        if self._pending:
+            self.dispatch()
+        return {key: self._cache.get(key) for key in keys}
+
+    def load(self, key: Hashable):
+        return self.load_many([key])[key]
+
+
+class Loaders:
+    """Набор загрузчиков для одного запроса"""
+
+    def __init__(self, db: Session):
+        self.users = DataLoader(lambda ids: self._by_id(db, models.User, ids))
+        self.memes = DataLoader(lambda ids: self._by_id(db, models.Meme, ids))
+
+    @staticmethod
+    def _by_id(db: Session, model, ids: List[int]) -> Dict:
+        rows = db.query(model).filter(model.id.in_(ids)).all()
+        return {row.id: row for row in rows}
+
+
+def get_loaders(db: Session = Depends(get_db)) -> Loaders:
+    return Loaders(db)
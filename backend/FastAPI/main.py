@@ -1,24 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import models
-from database import get_db, create_tables
+from database import get_db, create_tables, SessionLocal
 from auth import get_password_hash, verify_password, create_access_token, verify_token
+from ratelimit import rate_limit_middleware
+from follows import follower_cache, is_following_many, following_feed
+from loaders import Loaders, get_loaders
+import jobs
+from storage import reconcile_storage
+from tags import tag_analytics, normalize_tag, BUCKET_SECONDS, TRENDING_WINDOW_BUCKETS
 import shutil
 import os
 import uuid
 import json
 from datetime import datetime
-from sqlalchemy import or_
+from sqlalchemy import or_, func
+from sqlalchemy.exc import IntegrityError
 
 app = FastAPI(title="Meme App API")
 
 # OAuth2 схема для аутентификации
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Rate limiting и контроль нагрузки (до открытия сессии БД).
+# Регистрируем раньше CORS, чтобы ответы 429/503 тоже получали CORS-заголовки
+app.middleware("http")(rate_limit_middleware)
+
 # CORS для мобильного приложения
 app.add_middleware(
     CORSMiddleware,
@@ -38,6 +49,32 @@ MEME_UPLOAD_DIR = "uploads/memes"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(MEME_UPLOAD_DIR, exist_ok=True)
 
+# Максимум id в одном batchGet запросе
+BATCH_GET_MAX_IDS = 100
+
+# Прогреваем статистику тегов (один проход по мемам при старте)
+def warm_up_tag_analytics():
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Meme.tags, models.Meme.created_at).all()
+        tag_analytics.warm_up(rows)
+        print(f"🏷️ Tag analytics warmed up from {len(rows)} memes")
+    finally:
+        db.close()
+
+warm_up_tag_analytics()
+
+# Периодические фоновые задачи (выполняются воркерами: python jobs.py)
+def schedule_periodic_jobs():
+    db = SessionLocal()
+    try:
+        jobs.ensure_periodic(db, "jobs.cleanup", interval_seconds=24 * 60 * 60)
+        jobs.ensure_periodic(db, "storage.gc", interval_seconds=24 * 60 * 60)
+    finally:
+        db.close()
+
+schedule_periodic_jobs()
+
 # ----------------------------
 # Pydantic схемы
 # ----------------------------
@@ -126,6 +163,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def remove_upload(file_path: Optional[str]):
+    """Удаляет файл загрузки, если запись в базе так и не была сохранена"""
+    if not file_path:
+        return
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+def meme_to_dict(meme: models.Meme) -> Dict:
+    return {
+        "id": meme.id,
+        "image_url": meme.image_url,
+        "title": meme.title,
+        "description": meme.description,
+        "width": meme.width or 360,
+        "height": meme.height or 300,
+        "created_at": meme.created_at.isoformat() if meme.created_at else "",
+        "owner_id": meme.owner_id,
+        "likes_count": meme.likes_count or 0,
+        "tags": meme.tags or [],
+        "is_featured": meme.is_featured or False
+    }
+
 # ----------------------------
 # Эндпоинты аутентификации
 # ----------------------------
@@ -229,6 +290,20 @@ def get_users(db: Session = Depends(get_db)):
     users = db.query(models.User).all()
     return users
 
+@app.get("/users:batchGet")
+def batch_get_users(ids: List[int] = Query([]), loaders: Loaders = Depends(get_loaders)):
+    """Несколько профилей за один запрос, результат по id (отсутствующие - в missing)"""
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids are required")
+    if len(set(ids)) > BATCH_GET_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {BATCH_GET_MAX_IDS})")
+
+    users = loaders.users.load_many(ids)
+    return {
+        "users": {str(user_id): UserResponse.model_validate(user) for user_id, user in users.items() if user},
+        "missing": [user_id for user_id, user in users.items() if not user]
+    }
+
 @app.get("/users/{user_id}", response_model=UserResponse)
 def get_user_profile(user_id: int, db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -359,6 +434,7 @@ async def upload_avatar(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
+    file_path = None
     try:
         if not avatar.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
@@ -375,12 +451,14 @@ async def upload_avatar(
 
         current_user.avatar_url = avatar_url
         db.commit()
+        file_path = None  # файл уже привязан к пользователю
         db.refresh(current_user)
 
         return {"avatar_url": avatar_url, "message": "Avatar uploaded successfully"}
 
     except Exception as e:
         db.rollback()
+        remove_upload(file_path)
         raise HTTPException(status_code=500, detail=f"Error uploading avatar: {str(e)}")
 
 @app.put("/users/settings")
@@ -402,6 +480,157 @@ def update_settings(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating settings: {str(e)}")
 
+# ----------------------------
+# Эндпоинты подписок
+# ----------------------------
+def _get_user_or_404(db: Session, user_id: int) -> models.User:
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+@app.post("/users/{user_id}/follow")
+def follow_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="You cannot follow yourself")
+
+    target = _get_user_or_404(db, user_id)
+    existing = db.get(models.Follow, (current_user.id, user_id))
+    if existing:
+        return {"message": "Already following", "is_following": True}
+
+    try:
+        db.add(models.Follow(follower_id=current_user.id, followee_id=user_id))
+        db.query(models.User).filter(models.User.id == user_id).update(
+            {models.User.followers_count: func.coalesce(models.User.followers_count, 0) + 1},
+            synchronize_session=False
+        )
+        db.query(models.User).filter(models.User.id == current_user.id).update(
+            {models.User.following_count: func.coalesce(models.User.following_count, 0) + 1},
+            synchronize_session=False
+        )
+        db.commit()
+    except IntegrityError:
+        # Параллельный запрос (двойной тап) уже создал подписку
+        db.rollback()
+        return {"message": "Already following", "is_following": True}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error following user: {str(e)}")
+
+    follower_cache.on_follow(current_user.id, user_id)
+    db.refresh(target)
+    follower_cache.ensure(db, target)
+
+    return {"message": "Followed successfully", "is_following": True}
+
+@app.delete("/users/{user_id}/follow")
+def unfollow_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    try:
+        # Счетчики трогаем, только если удалили строку именно мы (двойной тап)
+        deleted = db.query(models.Follow).filter(
+            models.Follow.follower_id == current_user.id,
+            models.Follow.followee_id == user_id
+        ).delete(synchronize_session=False)
+        if deleted != 1:
+            db.rollback()
+            return {"message": "Not following", "is_following": False}
+
+        db.query(models.User).filter(models.User.id == user_id).update(
+            {models.User.followers_count: func.max(func.coalesce(models.User.followers_count, 0) - 1, 0)},
+            synchronize_session=False
+        )
+        db.query(models.User).filter(models.User.id == current_user.id).update(
+            {models.User.following_count: func.max(func.coalesce(models.User.following_count, 0) - 1, 0)},
+            synchronize_session=False
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error unfollowing user: {str(e)}")
+
+    follower_cache.on_unfollow(current_user.id, user_id)
+    return {"message": "Unfollowed successfully", "is_following": False}
+
+@app.get("/users/me/following/check")
+def check_following(
+    ids: List[int] = Query([]),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Подписан ли текущий пользователь на каждого из ids (для страницы карточек)"""
+    if len(set(ids)) > BATCH_GET_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {BATCH_GET_MAX_IDS})")
+
+    following = is_following_many(db, current_user.id, ids)
+    return {"following": {str(user_id): value for user_id, value in following.items()}}
+
+@app.get("/users/{user_id}/followers")
+def get_followers(user_id: int, limit: int = 20, cursor: Optional[int] = None, db: Session = Depends(get_db)):
+    """Подписчики пользователя, курсор - id последнего подписчика на странице"""
+    _get_user_or_404(db, user_id)
+    limit = max(1, min(limit, 100))
+
+    query = db.query(models.User).join(
+        models.Follow, models.Follow.follower_id == models.User.id
+    ).filter(models.Follow.followee_id == user_id)
+    if cursor is not None:
+        query = query.filter(models.Follow.follower_id < cursor)
+    users = query.order_by(models.Follow.follower_id.desc()).limit(limit + 1).all()
+
+    has_more = len(users) > limit
+    users = users[:limit]
+    return {
+        "users": [UserResponse.model_validate(user) for user in users],
+        "next_cursor": users[-1].id if has_more else None
+    }
+
+@app.get("/users/{user_id}/following")
+def get_following(user_id: int, limit: int = 20, cursor: Optional[int] = None, db: Session = Depends(get_db)):
+    """Подписки пользователя, курсор - id последнего пользователя на странице"""
+    _get_user_or_404(db, user_id)
+    limit = max(1, min(limit, 100))
+
+    query = db.query(models.User).join(
+        models.Follow, models.Follow.followee_id == models.User.id
+    ).filter(models.Follow.follower_id == user_id)
+    if cursor is not None:
+        query = query.filter(models.Follow.followee_id < cursor)
+    users = query.order_by(models.Follow.followee_id.desc()).limit(limit + 1).all()
+
+    has_more = len(users) > limit
+    users = users[:limit]
+    return {
+        "users": [UserResponse.model_validate(user) for user in users],
+        "next_cursor": users[-1].id if has_more else None
+    }
+
+@app.get("/feed/following")
+def get_following_feed(
+    limit: int = 20,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Лента мемов от авторов, на которых подписан пользователь"""
+    try:
+        limit = max(1, min(limit, 100))
+        memes = following_feed(db, current_user.id, limit, before_id)
+        return {
+            "memes": [meme_to_dict(meme) for meme in memes],
+            "next_before_id": memes[-1].id if len(memes) == limit else None
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting following feed: {str(e)}")
+
 # ----------------------------
 # Эндпоинты мемов
 # ----------------------------
@@ -513,6 +742,7 @@ async def create_meme(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
+    file_path = None
     try:
         if not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
@@ -568,8 +798,12 @@ async def create_meme(
         
         db.add(db_meme)
         db.commit()
+        file_path = None  # файл уже привязан к мему
         db.refresh(db_meme)
 
+        # Обновляем счетчики тегов только после успешного коммита
+        tag_analytics.record_meme(db_meme.tags)
+
         # Возвращаем данные с реальными размерами
         meme_response = {
             "id": db_meme.id,
@@ -590,6 +824,7 @@ async def create_meme(
 
     except Exception as e:
         db.rollback()
+        remove_upload(file_path)
         print(f"❌ Ошибка создания мема: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error creating meme: {str(e)}")
     
@@ -627,6 +862,33 @@ def get_user_memes(user_id: int, type: str = "created", db: Session = Depends(ge
         "memes": memes_data
     }
 
+@app.get("/memes:batchGet")
+def batch_get_memes(
+    ids: List[int] = Query([]),
+    include_owners: bool = False,
+    loaders: Loaders = Depends(get_loaders)
+):
+    """Несколько мемов за один запрос, по желанию вместе с авторами"""
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids are required")
+    if len(set(ids)) > BATCH_GET_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {BATCH_GET_MAX_IDS})")
+
+    memes = loaders.memes.load_many(ids)
+    response = {
+        "memes": {str(meme_id): meme_to_dict(meme) for meme_id, meme in memes.items() if meme},
+        "missing": [meme_id for meme_id, meme in memes.items() if not meme]
+    }
+
+    if include_owners:
+        owners = loaders.users.load_many(meme.owner_id for meme in memes.values() if meme)
+        response["owners"] = {
+            str(owner_id): UserResponse.model_validate(owner)
+            for owner_id, owner in owners.items() if owner
+        }
+
+    return response
+
 @app.get("/memes/{meme_id}", response_model=MemeResponse)
 def get_meme(meme_id: int, db: Session = Depends(get_db)):
     meme = db.query(models.Meme).filter(models.Meme.id == meme_id).first()
@@ -648,6 +910,63 @@ def get_meme(meme_id: int, db: Session = Depends(get_db)):
     
     return MemeResponse.model_validate(meme_response)
 
+# ----------------------------
+# Эндпоинты тегов
+# ----------------------------
+@app.get("/tags/trending")
+def get_trending_tags(limit: int = 20):
+    """Популярные теги за последний час (скользящее окно)"""
+    limit = max(1, min(limit, 100))
+    return {
+        "window_minutes": TRENDING_WINDOW_BUCKETS * BUCKET_SECONDS // 60,
+        "tags": tag_analytics.trending(limit)
+    }
+
+@app.get("/tags/top")
+def get_top_tags(limit: int = 20):
+    """Самые частые теги за все время (приближенно, heavy hitters)"""
+    limit = max(1, min(limit, 100))
+    return {"tags": tag_analytics.top(limit)}
+
+@app.get("/tags/{tag}/series")
+def get_tag_series(tag: str, minutes: int = 60):
+    """Временной ряд использования тега по минутам"""
+    clean_tag = normalize_tag(tag)
+    if not clean_tag:
+        raise HTTPException(status_code=400, detail="Invalid tag")
+
+    return {
+        "tag": clean_tag,
+        "bucket_seconds": BUCKET_SECONDS,
+        "total_estimate": tag_analytics.estimate(clean_tag),
+        "points": tag_analytics.series(clean_tag, minutes)
+    }
+
+# ----------------------------
+# Мониторинг фоновых задач и хранилища
+# ----------------------------
+@app.get("/jobs/stats")
+def get_jobs_stats(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Состояние очереди фоновых задач"""
+    try:
+        return jobs.stats(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting job stats: {str(e)}")
+
+@app.get("/storage/report")
+def get_storage_report(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Сколько места занимают файлы загрузок без ссылок из базы (без удаления)"""
+    try:
+        return reconcile_storage(db, dry_run=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building storage report: {str(e)}")
+
 # ----------------------------
 # Статические файлы
 # ----------------------------
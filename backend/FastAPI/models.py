@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, Text, JSON, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Text, JSON, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -34,7 +34,7 @@ class Meme(Base):
     description = Column(Text, nullable=True)
     width = Column(Integer, default=360)
     height = Column(Integer, default=300)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     likes_count = Column(Integer, default=0)
     tags = Column(JSON, default=[])
@@ -42,6 +42,40 @@ class Meme(Base):
     # Relationship
     owner = relationship("User", back_populates="memes")
 
+class Follow(Base):
+    __tablename__ = "follows"
+    
+    # Первичный ключ (follower_id, followee_id) - кто на кого подписан,
+    # обратный индекс - подписчики пользователя
+    follower_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_follows_followee_follower", "followee_id", "follower_id"),
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, index=True)
+    payload = Column(JSON, default={})
+    priority = Column(Integer, default=0)
+    status = Column(String, default="queued")  # queued / running / done / failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    interval_seconds = Column(Integer, nullable=True)  # для периодических задач
+    run_at = Column(DateTime, nullable=False)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_jobs_status_priority_run_at", "status", "priority", "run_at"),
+    )
+
 class Chat(Base):
     __tablename__ = "chats"
     
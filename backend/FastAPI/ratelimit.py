@@ -0,0 +1,207 @@
+# ratelimit.py
+import asyncio
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from auth import verify_token
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis необязателен, по умолчанию лимиты в памяти процесса
+    aioredis = None
+
+# Настройки
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+REDIS_TIMEOUT_SECONDS = 0.05        # зависший Redis не должен тормозить API
+BUCKET_IDLE_SECONDS = 600           # через сколько забываем неактивного клиента
+SWEEP_EVERY = 1000                  # как часто чистим неактивные бакеты
+
+# (rate токенов в секунду, burst) для отдельных маршрутов
+DEFAULT_LIMIT = (20.0, 40)
+ROUTE_LIMITS: Dict[Tuple[str, str], Tuple[float, int]] = {
+    ("GET", "/check-username"): (5.0, 10),
+    ("GET", "/check-email"): (5.0, 10),
+    ("GET", "/search/memes"): (2.0, 5),
+    ("GET", "/search/users"): (2.0, 5),
+    ("POST", "/login"): (1.0, 5),
+    ("POST", "/register"): (0.2, 3),
+    ("POST", "/memes"): (0.2, 3),
+    ("POST", "/users/upload-avatar"): (0.1, 2),
+    ("GET", "/storage/report"): (1 / 60, 1),   # полный обход папок загрузок
+    ("GET", "/jobs/stats"): (0.2, 3),
+}
+
+# Максимум одновременных запросов на маршрут (на процесс)
+ROUTE_CONCURRENCY: Dict[Tuple[str, str], int] = {
+    ("GET", "/search/memes"): 4,
+    ("GET", "/search/users"): 4,
+    ("POST", "/memes"): 4,
+    ("POST", "/users/upload-avatar"): 4,
+    ("GET", "/storage/report"): 1,
+}
+
+
+class MemoryBackend:
+    """Token bucket в памяти процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._calls = 0
+
+    def _sweep(self, now: float):
+        stale = [key for key, (_, updated) in self._buckets.items()
+                 if now - updated > BUCKET_IDLE_SECONDS]
+        for key in stale:
+            del self._buckets[key]
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        """Забирает токен. Возвращает 0 если можно, иначе секунды до следующего токена"""
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % SWEEP_EVERY == 0:
+                self._sweep(now)
+
+            tokens, updated = self._buckets.get(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+
+class RedisBackend:
+    """Token bucket в Redis - общий для нескольких воркеров"""
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        # Асинхронный клиент не блокирует event loop, таймауты короткие
+        self._client = aioredis.Redis.from_url(
+            url,
+            socket_timeout=REDIS_TIMEOUT_SECONDS,
+            socket_connect_timeout=REDIS_TIMEOUT_SECONDS
+        )
+        self._script = self._client.register_script(self.SCRIPT)
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        # Общий предел на случай ретраев клиента поверх socket-таймаутов
+        wait = await asyncio.wait_for(
+            self._script(
+                keys=[f"ratelimit:{key}"],
+                args=[rate, burst, time.time(), BUCKET_IDLE_SECONDS]
+            ),
+            timeout=REDIS_TIMEOUT_SECONDS * 2
+        )
+        return float(wait)
+
+
+class ConcurrencyLimiter:
+    """Счетчик запросов в обработке для каждого маршрута"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[str, str], int] = {}
+
+    def try_enter(self, route: Tuple[str, str], limit: int) -> bool:
+        with self._lock:
+            current = self._in_flight.get(route, 0)
+            if current >= limit:
+                return False
+            self._in_flight[route] = current + 1
+            return True
+
+    def leave(self, route: Tuple[str, str]):
+        with self._lock:
+            self._in_flight[route] -= 1
+
+
+def create_backend():
+    if RATE_LIMIT_REDIS_URL and aioredis is not None:
+        print("🚦 Rate limiting: using Redis backend")
+        return RedisBackend(RATE_LIMIT_REDIS_URL)
+    if RATE_LIMIT_REDIS_URL:
+        print("⚠️ RATE_LIMIT_REDIS_URL is set but redis is not installed, using memory backend")
+    return MemoryBackend()
+
+
+backend = create_backend()
+concurrency = ConcurrencyLimiter()
+
+
+def client_key(request) -> str:
+    """Пользователь из JWT, если он есть, иначе IP клиента"""
+    auth_header = request.headers.get("authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        payload = verify_token(auth_header[7:])
+        if payload and payload.get("sub"):
+            return f"user:{payload['sub']}"
+    client_ip = request.client.host if request.client else "unknown"
+    return f"ip:{client_ip}"
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+async def rate_limit_middleware(request, call_next):
+    """
+    Отсекает лишние запросы до вызова эндпоинта,
+    то есть до открытия сессии БД в get_db.
+    """
+    if not RATE_LIMIT_ENABLED or request.url.path.startswith("/static/"):
+        return await call_next(request)
+
+    route = (request.method, request.url.path)
+    rate, burst = ROUTE_LIMITS.get(route, DEFAULT_LIMIT)
+    limit_key = f"{client_key(request)}:{route[0]}:{route[1] if route in ROUTE_LIMITS else '*'}"
+
+    try:
+        wait = await backend.acquire(limit_key, rate, burst)
+    except Exception as e:
+        # Если общий бэкенд недоступен, лучше пропустить запрос, чем уронить API
+        print(f"⚠️ Rate limit backend error: {str(e)}")
+        wait = 0.0
+
+    if wait > 0:
+        return _reject(429, "Too many requests", wait)
+
+    max_in_flight: Optional[int] = ROUTE_CONCURRENCY.get(route)
+    if max_in_flight is None:
+        return await call_next(request)
+
+    if not concurrency.try_enter(route, max_in_flight):
+        return _reject(503, "Server is busy, try again later", 1)
+    try:
+        return await call_next(request)
+    finally:
+        concurrency.leave(route)
@@ -0,0 +1,104 @@
+# storage.py
+import os
+import time
+from typing import Dict, Iterator, List, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+
+# Настройки
+GC_GRACE_SECONDS = 24 * 60 * 60     # моложе этого файлы не трогаем (загрузка еще может коммититься)
+GC_BATCH_SIZE = 500
+
+# Папка загрузок -> колонка, в которой хранятся ссылки на ее файлы
+STORAGE_DIRS = {
+    "uploads/avatars": models.User.avatar_url,
+    "uploads/memes": models.Meme.image_url,
+}
+
+
+def _referenced_names(db: Session, column) -> Set[str]:
+    """Имена файлов, на которые ссылается база (URL может быть с любым хостом)"""
+    names = set()
+    for (url,) in db.query(column).filter(column.isnot(None)).yield_per(1000):
+        names.add(url.rsplit("/", 1)[-1])
+    return names
+
+
+def _scan_batches(path: str, batch_size: int) -> Iterator[List[Tuple[str, int, float]]]:
+    """Обходит папку через os.scandir, отдавая (имя, размер, mtime) пачками"""
+    batch = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            batch.append((entry.name, stat.st_size, stat.st_mtime))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def reconcile_directory(db: Session, path: str, column, dry_run: bool = True,
+                        grace_seconds: int = GC_GRACE_SECONDS,
+                        batch_size: int = GC_BATCH_SIZE) -> Dict:
+    report = {
+        "scanned": 0,
+        "referenced": 0,
+        "orphaned": 0,
+        "skipped_recent": 0,
+        "reclaimable_bytes": 0,
+        "deleted": 0,
+        "deleted_bytes": 0,
+    }
+    if not os.path.isdir(path):
+        return report
+
+    # Ссылки загружаем до обхода: файл, загруженный позже, будет моложе grace period
+    referenced = _referenced_names(db, column)
+    cutoff = time.time() - grace_seconds
+
+    for batch in _scan_batches(path, batch_size):
+        for name, size, mtime in batch:
+            report["scanned"] += 1
+            if name in referenced:
+                report["referenced"] += 1
+                continue
+            if mtime > cutoff:
+                report["skipped_recent"] += 1
+                continue
+
+            report["orphaned"] += 1
+            report["reclaimable_bytes"] += size
+            if dry_run:
+                continue
+            try:
+                os.remove(os.path.join(path, name))
+                report["deleted"] += 1
+                report["deleted_bytes"] += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Could not remove {name}: {str(e)}")
+
+    return report
+
+
+def reconcile_storage(db: Session, dry_run: bool = True,
+                      grace_seconds: int = GC_GRACE_SECONDS,
+                      batch_size: int = GC_BATCH_SIZE) -> Dict:
+    """Сверяет папки загрузок с базой и (если не dry_run) удаляет файлы-сироты"""
+    directories = {
+        path: reconcile_directory(db, path, column, dry_run, grace_seconds, batch_size)
+        for path, column in STORAGE_DIRS.items()
+    }
+    return {
+        "dry_run": dry_run,
+        "grace_seconds": grace_seconds,
+        "directories": directories,
+        "reclaimable_bytes": sum(d["reclaimable_bytes"] for d in directories.values()),
+        "deleted_bytes": sum(d["deleted_bytes"] for d in directories.values()),
+    }
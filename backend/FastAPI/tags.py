@@ -0,0 +1,222 @@
+# tags.py
+import hashlib
+import heapq
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+# Настройки
+BUCKET_SECONDS = 60                 # ширина одного бакета временного ряда
+RETENTION_BUCKETS = 24 * 60         # сколько бакетов храним (24 часа)
+TRENDING_WINDOW_BUCKETS = 60        # окно для трендов (1 час)
+HEAVY_HITTERS_CAPACITY = 200        # размер Space-Saving сводки
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+
+MEME_WEIGHT = 1
+
+
+def normalize_tag(tag) -> Optional[str]:
+    """Приводит тег к каноническому виду: без #, пробелов и регистра"""
+    if not isinstance(tag, str):
+        return None
+    clean = tag.strip().lstrip('#').strip().lower()
+    return clean or None
+
+
+def _bucket_of(ts: float) -> int:
+    return int(ts // BUCKET_SECONDS)
+
+
+class CountMinSketch:
+    """Count-Min sketch: оценка частоты с ограниченной памятью (только завышение)"""
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.depth).digest()
+        for row in range(self.depth):
+            chunk = digest[row * 8:(row + 1) * 8]
+            yield row, int.from_bytes(chunk, "little") % self.width
+
+    def add(self, key: str, count: int = 1):
+        for row, idx in self._indexes(key):
+            self.rows[row][idx] += count
+
+    def estimate(self, key: str) -> int:
+        return min(self.rows[row][idx] for row, idx in self._indexes(key))
+
+
+class SpaceSaving:
+    """Space-Saving top-k: держит не более capacity самых частых ключей"""
+
+    def __init__(self, capacity: int = HEAVY_HITTERS_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, key: str, count: int = 1):
+        if key in self.counts:
+            self.counts[key] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+            return
+        # Вытесняем минимальный ключ, новый наследует его счетчик как погрешность
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        self.errors.pop(victim, None)
+        self.counts[key] = floor + count
+        self.errors[key] = floor
+
+    def top(self, limit: int) -> List[Dict]:
+        items = heapq.nlargest(limit, self.counts.items(), key=lambda kv: kv[1])
+        return [
+            {"tag": tag, "count": count, "error": self.errors.get(tag, 0)}
+            for tag, count in items
+        ]
+
+
+class TagAnalytics:
+    """
+    Инкрементальная статистика по тегам.
+    Счетчики обновляются при создании мема (лайки пока не учитываются),
+    поэтому запросы не зависят от количества мемов в базе.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = deque()           # (bucket_id, Counter) в порядке времени
+        self._window = Counter()          # сумма бакетов в окне трендов
+        self._window_start = 0            # первый бакет, входящий в окно
+        self._sketch = CountMinSketch()
+        self._heavy = SpaceSaving()
+
+    # ---------- обновление ----------
+
+    def _advance(self, now_bucket: int):
+        # Бакеты, вышедшие из окна трендов, вычитаем из скользящей суммы
+        new_start = now_bucket - TRENDING_WINDOW_BUCKETS + 1
+        if new_start > self._window_start:
+            for bucket_id, counter in self._buckets:
+                if bucket_id >= new_start:
+                    break
+                if bucket_id >= self._window_start:
+                    self._window.subtract(counter)
+            self._window = +self._window  # убираем нули и отрицательные
+            self._window_start = new_start
+
+        # Старые бакеты удаляем целиком
+        oldest_allowed = now_bucket - RETENTION_BUCKETS + 1
+        while self._buckets and self._buckets[0][0] < oldest_allowed:
+            self._buckets.popleft()
+
+    def _bucket_counter(self, bucket_id: int) -> Counter:
+        if self._buckets and self._buckets[-1][0] == bucket_id:
+            return self._buckets[-1][1]
+        if not self._buckets or self._buckets[-1][0] < bucket_id:
+            counter = Counter()
+            self._buckets.append((bucket_id, counter))
+            return counter
+        # Событие из прошлого (прогрев из БД) - ищем нужный бакет
+        for idx, (existing_id, counter) in enumerate(self._buckets):
+            if existing_id == bucket_id:
+                return counter
+            if existing_id > bucket_id:
+                counter = Counter()
+                self._buckets.insert(idx, (bucket_id, counter))
+                return counter
+        counter = Counter()
+        self._buckets.append((bucket_id, counter))
+        return counter
+
+    def record(self, tags: Iterable, weight: int = 1, ts: Optional[float] = None):
+        """Учитывает теги с весом weight в момент ts (по умолчанию - сейчас)"""
+        # tags хранятся как произвольный JSON - строку или число за список не считаем
+        if not isinstance(tags, (list, tuple)):
+            return
+        clean_tags = {t for t in (normalize_tag(tag) for tag in tags) if t}
+        if not clean_tags:
+            return
+
+        now_bucket = _bucket_of(time.time())
+        event_bucket = _bucket_of(ts) if ts is not None else now_bucket
+
+        with self._lock:
+            for tag in clean_tags:
+                self._sketch.add(tag, weight)
+                self._heavy.add(tag, weight)
+
+            self._advance(now_bucket)
+            if event_bucket <= now_bucket - RETENTION_BUCKETS:
+                return
+
+            counter = self._bucket_counter(event_bucket)
+            for tag in clean_tags:
+                counter[tag] += weight
+                if event_bucket >= self._window_start:
+                    self._window[tag] += weight
+
+    def record_meme(self, tags: Iterable, ts: Optional[float] = None):
+        self.record(tags, MEME_WEIGHT, ts)
+
+    # ---------- запросы ----------
+
+    def trending(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            self._advance(_bucket_of(time.time()))
+            items = heapq.nlargest(limit, self._window.items(), key=lambda kv: kv[1])
+        return [{"tag": tag, "count": count} for tag, count in items]
+
+    def top(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            return self._heavy.top(limit)
+
+    def estimate(self, tag: str) -> int:
+        clean = normalize_tag(tag)
+        if not clean:
+            return 0
+        with self._lock:
+            return self._sketch.estimate(clean)
+
+    def series(self, tag: str, minutes: int = 60) -> List[Dict]:
+        """Временной ряд по тегу за последние minutes минут (пустые бакеты = 0)"""
+        clean = normalize_tag(tag)
+        buckets_count = max(1, min(RETENTION_BUCKETS, (minutes * 60) // BUCKET_SECONDS))
+        now_bucket = _bucket_of(time.time())
+        first_bucket = now_bucket - buckets_count + 1
+
+        with self._lock:
+            self._advance(now_bucket)
+            counts = {
+                bucket_id: counter.get(clean, 0)
+                for bucket_id, counter in self._buckets
+                if bucket_id >= first_bucket
+            }
+
+        return [
+            {
+                "ts": datetime.fromtimestamp(bucket_id * BUCKET_SECONDS, tz=timezone.utc).isoformat(),
+                "count": counts.get(bucket_id, 0),
+            }
+            for bucket_id in range(first_bucket, now_bucket + 1)
+        ]
+
+    def warm_up(self, rows: Iterable):
+        """Прогрев из БД при старте: rows - пары (tags, created_at), как при create_meme"""
+        for tags, created_at in rows:
+            ts = None
+            if created_at is not None:
+                if created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=timezone.utc)
+                ts = created_at.timestamp()
+            self.record_meme(tags, ts)
+
+
+tag_analytics = TagAnalytics()
@@ -0,0 +1,38 @@
+# tasks.py
+from datetime import datetime, timedelta
+
+import models
+from jobs import task
+from storage import reconcile_storage, GC_GRACE_SECONDS
+
+# Сколько храним завершенные задачи
+DONE_JOBS_TTL_DAYS = 7
+FAILED_JOBS_TTL_DAYS = 30
+
+
+@task("jobs.cleanup")
+def cleanup_jobs(db, payload):
+    """Удаляет старые завершенные и упавшие задачи, чтобы таблица не росла"""
+    now = datetime.utcnow()
+    done = db.query(models.Job).filter(
+        models.Job.status == "done",
+        models.Job.run_at < now - timedelta(days=payload.get("done_ttl_days", DONE_JOBS_TTL_DAYS))
+    ).delete(synchronize_session=False)
+    failed = db.query(models.Job).filter(
+        models.Job.status == "failed",
+        models.Job.run_at < now - timedelta(days=payload.get("failed_ttl_days", FAILED_JOBS_TTL_DAYS))
+    ).delete(synchronize_session=False)
+    db.commit()
+    print(f"🧹 Jobs cleanup: removed {done} done and {failed} failed jobs")
+
+
+@task("storage.gc")
+def storage_gc(db, payload):
+    """Удаляет файлы загрузок, на которые больше не ссылается база"""
+    report = reconcile_storage(
+        db,
+        dry_run=payload.get("dry_run", False),
+        grace_seconds=payload.get("grace_seconds", GC_GRACE_SECONDS)
+    )
+    print(f"🧹 Storage GC: removed {report['deleted_bytes']} bytes, "
+          f"reclaimable {report['reclaimable_bytes']} bytes")